@@ -1,42 +1,24 @@
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-import io
+import contextlib
 import torch
-import torch.nn as nn
-import torch.nn.functional as F
-from torchvision import transforms
 from pathlib import Path
 from datetime import datetime
 
-# ============================================================
-# ✅ Custom Retina CNN
-# ============================================================
-class RetinaCNN(nn.Module):
-    def __init__(self, num_classes=4):
-        super(RetinaCNN, self).__init__()
-        self.conv1 = nn.Conv2d(3, 32, kernel_size=3, stride=1, padding=1)
-        self.pool1 = nn.MaxPool2d(2, 2)
-        self.conv2 = nn.Conv2d(32, 64, kernel_size=3, stride=1, padding=1)
-        self.pool2 = nn.MaxPool2d(2, 2)
-        self.conv3 = nn.Conv2d(64, 128, kernel_size=3, stride=1, padding=1)
-        self.pool3 = nn.MaxPool2d(2, 2)
-        self.dropout = nn.Dropout(0.5)
-        self.fc1 = nn.Linear(128 * 28 * 28, 256)
-        self.fc2 = nn.Linear(256, num_classes)
-
-    def forward(self, x):
-        x = F.relu(self.conv1(x)); x = self.pool1(x)
-        x = F.relu(self.conv2(x)); x = self.pool2(x)
-        x = F.relu(self.conv3(x)); x = self.pool3(x)
-        x = torch.flatten(x, 1)
-        x = self.dropout(F.relu(self.fc1(x)))
-        return self.fc2(x)
+from inference import InferenceEngine
+from model import load_model
 
 # ============================================================
 # ✅ FastAPI setup
 # ============================================================
-app = FastAPI(title="Retina CNN Backend")
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Run the engine's request batch worker (see inference.py) for the server's lifetime."""
+    async with engine.serve():
+        yield
+
+
+app = FastAPI(title="Retina CNN Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -55,6 +37,11 @@ app.add_middleware(
 # ============================================================
 DATASET_DIR = Path(__file__).parent / "retinal-samples"
 MODEL_PATH = Path(__file__).parent / "model.pth"
+INT8_MODEL_PATH = Path(__file__).parent / "model_int8.pth"
+
+MAX_BATCH_SIZE = 8
+BATCH_TIMEOUT_S = 0.008
+GRAPH_BATCH_SIZES = (1, 2, 4, 8)
 
 if DATASET_DIR.exists():
     CLASS_NAMES = sorted([p.name for p in DATASET_DIR.iterdir() if p.is_dir()])
@@ -69,28 +56,26 @@ device = (
 print(f"🧠 Using device: {device}")
 
 # ============================================================
-# ✅ Load trained CNN model
+# ✅ Load trained CNN model (TorchScript / TensorRT / INT8)
 # ============================================================
-model = RetinaCNN(num_classes=len(CLASS_NAMES))
-state_dict = torch.load(MODEL_PATH, map_location=device)
-model.load_state_dict(state_dict)
-model.to(device)
-model.eval()
-
-print(f"✅ Loaded RetinaCNN model from: {MODEL_PATH}")
+# Inputs are (N, 3, 224, 224) with N <= MAX_BATCH_SIZE (see the request
+# batcher in inference.py); load_model caches the traced/compiled module on disk.
+model = load_model(
+    MODEL_PATH,
+    device,
+    num_classes=len(CLASS_NAMES),
+    max_batch_size=MAX_BATCH_SIZE,
+    int8_path=INT8_MODEL_PATH,
+)
 print(f"📊 Classes: {CLASS_NAMES}")
 
-# ============================================================
-# ✅ Image preprocessing
-# ============================================================
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225]
-    )
-])
+engine = InferenceEngine(
+    model,
+    device,
+    max_batch_size=MAX_BATCH_SIZE,
+    batch_timeout_s=BATCH_TIMEOUT_S,
+    graph_batch_sizes=GRAPH_BATCH_SIZES,
+)
 
 # ============================================================
 # ✅ Routes
@@ -107,12 +92,8 @@ def status():
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
     image_bytes = await file.read()
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    input_tensor = transform(image).unsqueeze(0).to(device)
-
-    with torch.no_grad():
-        outputs = model(input_tensor)
-        probs = F.softmax(outputs, dim=1)[0]
+    input_tensor = engine.preprocess(image_bytes)
+    probs = await engine.infer(input_tensor)
 
     top_idx = probs.argmax().item()
     confidence = float(probs[top_idx])
@@ -0,0 +1,118 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from torchvision import datasets, transforms
+from tqdm import tqdm
+
+# ============================================================
+# ✅ Configuration
+# ============================================================
+DATA_DIR = "retinal-samples"   # folder containing class subfolders
+CACHE_DIR = "retinal-cache"    # output folder for the preprocessed arrays
+IMAGE_SIZE = 224
+
+IMAGES_FILE = "images.npy"    # (N, 3, 224, 224) uint8, memory-mapped
+LABELS_FILE = "labels.npy"    # (N,) int64
+MANIFEST_FILE = "manifest.json"  # classes + fingerprint of DATA_DIR
+
+
+# ============================================================
+# ✅ One-time preprocessing
+# ============================================================
+def source_fingerprint(data_dir=DATA_DIR):
+    """Image count and newest mtime under ``data_dir``, used to detect a stale cache.
+
+    Class directory mtimes are included so removed images are noticed too.
+    """
+    samples = datasets.ImageFolder(data_dir).samples
+    paths = [p for p, _ in samples]
+    paths += [entry.path for entry in os.scandir(data_dir) if entry.is_dir()]
+    return {
+        "num_images": len(samples),
+        "newest_mtime": max((os.path.getmtime(p) for p in paths), default=0.0),
+    }
+
+
+def build_cache(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Decode + resize every image once and store it as uint8 in a .npy memmap.
+
+    Only the deterministic part of the pipeline (decode, resize) is cached;
+    random augmentation and normalization still run at train time.
+    The manifest records a fingerprint of ``data_dir`` so ``cache_is_current``
+    can tell when the dataset has changed.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fingerprint = source_fingerprint(data_dir)
+
+    dataset = datasets.ImageFolder(
+        data_dir,
+        transform=transforms.Compose([
+            transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
+            transforms.PILToTensor(),
+        ]),
+    )
+
+    images = np.lib.format.open_memmap(
+        cache_dir / IMAGES_FILE,
+        mode="w+",
+        dtype=np.uint8,
+        shape=(len(dataset), 3, IMAGE_SIZE, IMAGE_SIZE),
+    )
+    labels = np.empty(len(dataset), dtype=np.int64)
+
+    for i, (image, label) in enumerate(tqdm(dataset, desc="Caching images")):
+        images[i] = image.numpy()
+        labels[i] = label
+
+    images.flush()
+    del images
+    np.save(cache_dir / LABELS_FILE, labels)
+    with open(cache_dir / MANIFEST_FILE, "w") as f:
+        json.dump({"classes": dataset.classes, **fingerprint}, f)
+
+    print(f"✅ Cached {len(dataset)} images to {cache_dir}")
+
+
+# ============================================================
+# ✅ Dataset backed by the cache
+# ============================================================
+class CachedImageDataset(Dataset):
+    """Serves ``(uint8 CHW tensor, label)`` pairs from a cache built by ``build_cache``."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.labels = np.load(self.cache_dir / LABELS_FILE)
+        with open(self.cache_dir / MANIFEST_FILE) as f:
+            self.classes = json.load(f)["classes"]
+        # Opened lazily so each DataLoader worker maps the file itself
+        # instead of pickling the array across processes.
+        self._images = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._images = np.load(self.cache_dir / IMAGES_FILE, mmap_mode="r")
+        image = torch.from_numpy(np.array(self._images[idx]))
+        return image, int(self.labels[idx])
+
+
+def cache_is_current(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """True if the cache exists and was built from the current contents of ``data_dir``."""
+    cache_dir = Path(cache_dir)
+    if not all((cache_dir / name).exists() for name in (IMAGES_FILE, LABELS_FILE, MANIFEST_FILE)):
+        return False
+    with open(cache_dir / MANIFEST_FILE) as f:
+        manifest = json.load(f)
+    fingerprint = source_fingerprint(data_dir)
+    return all(manifest.get(key) == value for key, value in fingerprint.items())
+
+
+if __name__ == "__main__":
+    build_cache()
@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import io
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torchvision import transforms
+from torchvision.io import ImageReadMode, decode_jpeg
+
+# ============================================================
+# ✅ Image preprocessing
+# ============================================================
+NORM_MEAN = [0.485, 0.456, 0.406]
+NORM_STD = [0.229, 0.224, 0.225]
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(NORM_MEAN, NORM_STD)
+])
+
+
+# ============================================================
+# ✅ Shared inference engine for app.py / main.py
+# ============================================================
+class InferenceEngine:
+    """Preprocesses uploads and runs batched, CUDA Graph-backed inference.
+
+    ``model`` is the TorchScript module returned by ``model.load_model``; it
+    must accept (N, 3, 224, 224) inputs with N <= ``max_batch_size``.
+    """
+
+    def __init__(self, model, device, max_batch_size=8, batch_timeout_s=0.008,
+                 graph_batch_sizes=(1, 2, 4, 8)):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.batch_timeout_s = batch_timeout_s
+        self.norm_mean = torch.tensor(NORM_MEAN, device=device).view(1, 3, 1, 1)
+        self.norm_std = torch.tensor(NORM_STD, device=device).view(1, 3, 1, 1)
+        self._queue = None
+
+        # Pay any remaining lazy optimization cost before the first request.
+        with torch.inference_mode():
+            model(torch.zeros(1, 3, 224, 224, device=device))
+
+        self.graphs = {}  # batch size -> (graph, static_input, static_output)
+        if device == "cuda":
+            self._capture_graphs(graph_batch_sizes)
+
+    # --------------------------------------------------------
+    # CUDA Graphs
+    # --------------------------------------------------------
+    def _capture_graphs(self, batch_sizes):
+        """Record the forward once per batch size against static input buffers.
+
+        Batches are padded up to the nearest captured size when replayed.
+        Every request is resized to 224x224 during preprocessing, so the
+        captured shapes always match.
+        """
+        side_stream = torch.cuda.Stream()
+        # All graphs share one memory pool. That is safe here because replays
+        # never overlap and each static output stays referenced in
+        # self.graphs. Capturing the largest batch first lets the smaller
+        # graphs reuse its intermediate buffers.
+        pool = None
+        for batch_size in sorted(batch_sizes, reverse=True):
+            static_input = torch.zeros(batch_size, 3, 224, 224, device=self.device)
+            side_stream.wait_stream(torch.cuda.current_stream())
+            with torch.inference_mode(), torch.cuda.stream(side_stream):
+                for _ in range(3):
+                    self.model(static_input)
+            torch.cuda.current_stream().wait_stream(side_stream)
+            try:
+                graph = torch.cuda.CUDAGraph()
+                with torch.inference_mode(), torch.cuda.graph(graph, pool=pool):
+                    static_output = self.model(static_input)
+                pool = graph.pool()
+            except RuntimeError as e:
+                self.graphs = {}
+                print(f"⚠️ CUDA Graph capture failed, running without it: {e}")
+                return
+            self.graphs[batch_size] = (graph, static_input, static_output)
+        print(f"⚡ Captured CUDA Graphs for batch sizes {sorted(self.graphs)}")
+
+    def run_model(self, batch):
+        """Return logits for an (N, 3, 224, 224) batch, replaying a CUDA Graph if available."""
+        n = batch.size(0)
+        captured = [size for size in self.graphs if size >= n]
+        if not captured:
+            return self.model(batch)
+        graph, static_input, static_output = self.graphs[min(captured)]
+        # Rows past n keep stale data; their outputs are sliced off below.
+        static_input[:n].copy_(batch, non_blocking=True)
+        graph.replay()
+        return static_output[:n]
+
+    # --------------------------------------------------------
+    # Preprocessing
+    # --------------------------------------------------------
+    def preprocess(self, image_bytes):
+        """Return a normalized (1, 3, 224, 224) float tensor on the engine's device.
+
+        JPEG uploads are decoded by nvJPEG straight into device memory on
+        CUDA, skipping the PIL decode and the H2D copy. Other formats, other
+        devices and JPEGs nvJPEG can't handle fall back to the PIL transform.
+        """
+        if self.device == "cuda" and image_bytes[:3] == JPEG_MAGIC:
+            try:
+                data = torch.frombuffer(bytearray(image_bytes), dtype=torch.uint8)
+                img = decode_jpeg(data, mode=ImageReadMode.RGB, device=self.device)
+                img = F.interpolate(img.unsqueeze(0).float(), size=(224, 224),
+                                    mode="bilinear", align_corners=False, antialias=True)
+                return (img / 255 - self.norm_mean) / self.norm_std
+            except RuntimeError:
+                pass
+        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        return transform(image).unsqueeze(0).to(self.device)
+
+    # --------------------------------------------------------
+    # Request batching
+    # --------------------------------------------------------
+    # Concurrent requests are queued and coalesced into one forward pass of
+    # up to max_batch_size images, waiting at most batch_timeout_s for more
+    # requests after the first one arrives.
+    @contextlib.asynccontextmanager
+    async def serve(self):
+        """Run the batch worker while the context is open (use from an app lifespan).
+
+        The queue and worker task are created here so they bind to the
+        server's event loop.
+        """
+        self._queue = asyncio.Queue()
+        worker = asyncio.create_task(self._batch_worker())
+        try:
+            yield
+        finally:
+            worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await worker
+
+    async def _batch_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + self.batch_timeout_s
+            while len(items) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                batch = torch.cat([tensor for tensor, _ in items])
+                with torch.inference_mode():
+                    probs = F.softmax(self.run_model(batch), dim=1).cpu()
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for i, (_, future) in enumerate(items):
+                if not future.done():  # the client may have disconnected
+                    future.set_result(probs[i])
+
+    async def infer(self, input_tensor):
+        """Queue a (1, 3, 224, 224) tensor for batched inference and return its class probabilities."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((input_tensor, future))
+        return await future
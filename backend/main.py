@@ -1,43 +1,25 @@
 from fastapi import FastAPI, File, UploadFile
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
 import torch
-import torch.nn.functional as F
-from torchvision import transforms
 from pathlib import Path
 from datetime import datetime
-import io, os, json
-import torch.nn as nn
+import contextlib, os, json
 
-# ============================================================
-# ✅ Retina CNN model
-# ============================================================
-class RetinaCNN(nn.Module):
-    def __init__(self, num_classes=4):
-        super(RetinaCNN, self).__init__()
-        self.conv1 = nn.Conv2d(3, 32, kernel_size=3, stride=1, padding=1)
-        self.pool1 = nn.MaxPool2d(2, 2)
-        self.conv2 = nn.Conv2d(32, 64, kernel_size=3, stride=1, padding=1)
-        self.pool2 = nn.MaxPool2d(2, 2)
-        self.conv3 = nn.Conv2d(64, 128, kernel_size=3, stride=1, padding=1)
-        self.pool3 = nn.MaxPool2d(2, 2)
-        self.dropout = nn.Dropout(0.5)
-        self.fc1 = nn.Linear(128 * 28 * 28, 256)
-        self.fc2 = nn.Linear(256, num_classes)
-
-    def forward(self, x):
-        x = F.relu(self.conv1(x)); x = self.pool1(x)
-        x = F.relu(self.conv2(x)); x = self.pool2(x)
-        x = F.relu(self.conv3(x)); x = self.pool3(x)
-        x = torch.flatten(x, 1)
-        x = self.dropout(F.relu(self.fc1(x)))
-        return self.fc2(x)
+from inference import InferenceEngine
+from model import load_model
 
 # ============================================================
 # ✅ App setup
 # ============================================================
-app = FastAPI(title="RETINA CNN Backup Backend", version="2.0")
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Run the engine's request batch worker (see inference.py) for the server's lifetime."""
+    async with engine.serve():
+        yield
+
+
+app = FastAPI(title="RETINA CNN Backup Backend", version="2.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -53,9 +35,14 @@ app.add_middleware(
 
 BASE_DIR = Path(__file__).parent
 MODEL_PATH = BASE_DIR / "model.pth"
+INT8_MODEL_PATH = BASE_DIR / "model_int8.pth"
 DATASET_DIR = BASE_DIR / "retinal-samples"
 MODEL_INFO_PATH = BASE_DIR / "model_info.json"
 
+MAX_BATCH_SIZE = 8
+BATCH_TIMEOUT_S = 0.008
+GRAPH_BATCH_SIZES = (1, 2, 4, 8)
+
 device = (
     "cuda" if torch.cuda.is_available()
     else "mps" if torch.backends.mps.is_available()
@@ -74,25 +61,25 @@ else:
 print(f"📂 Classes detected: {CLASS_NAMES}")
 
 # ============================================================
-# ✅ Load trained CNN model
+# ✅ Load trained CNN model (TorchScript / TensorRT / INT8)
 # ============================================================
-model = RetinaCNN(num_classes=len(CLASS_NAMES))
-state_dict = torch.load(MODEL_PATH, map_location=device)
-model.load_state_dict(state_dict)
-model.to(device)
-model.eval()
-
-print(f"✅ Loaded RetinaCNN model from: {MODEL_PATH}")
+# Inputs are (N, 3, 224, 224) with N <= MAX_BATCH_SIZE (see the request
+# batcher in inference.py); load_model caches the traced/compiled module on disk.
+model = load_model(
+    MODEL_PATH,
+    device,
+    num_classes=len(CLASS_NAMES),
+    max_batch_size=MAX_BATCH_SIZE,
+    int8_path=INT8_MODEL_PATH,
+)
 
-# ============================================================
-# ✅ Transform
-# ============================================================
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
+engine = InferenceEngine(
+    model,
+    device,
+    max_batch_size=MAX_BATCH_SIZE,
+    batch_timeout_s=BATCH_TIMEOUT_S,
+    graph_batch_sizes=GRAPH_BATCH_SIZES,
+)
 
 # ============================================================
 # ✅ Routes
@@ -110,13 +97,10 @@ async def predict(file: UploadFile = File(...)):
     try:
         # Read and preprocess image
         image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        img_tensor = transform(image).unsqueeze(0).to(device)
+        img_tensor = engine.preprocess(image_bytes)
 
-        # Run inference
-        with torch.no_grad():
-            outputs = model(img_tensor)
-            probs = F.softmax(outputs, dim=1)[0]
+        # Run inference (batched with concurrent requests)
+        probs = await engine.infer(img_tensor)
 
         # Get top prediction
         top_idx = probs.argmax().item()
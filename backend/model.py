@@ -0,0 +1,131 @@
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# ============================================================
+# ✅ CNN Model Definition
+# ============================================================
+class RetinaCNN(nn.Module):
+    def __init__(self, num_classes=4):
+        super(RetinaCNN, self).__init__()
+        self.conv1 = nn.Conv2d(3, 32, kernel_size=3, stride=1, padding=1)
+        self.pool1 = nn.MaxPool2d(2, 2)
+
+        self.conv2 = nn.Conv2d(32, 64, kernel_size=3, stride=1, padding=1)
+        self.pool2 = nn.MaxPool2d(2, 2)
+
+        self.conv3 = nn.Conv2d(64, 128, kernel_size=3, stride=1, padding=1)
+        self.pool3 = nn.MaxPool2d(2, 2)
+
+        self.gap = nn.AdaptiveAvgPool2d(1)  # (N, 128, 28, 28) -> (N, 128, 1, 1)
+        self.dropout = nn.Dropout(0.5)
+        self.fc1 = nn.Linear(128, 256)
+        self.fc2 = nn.Linear(256, num_classes)
+
+    def forward(self, x):
+        x = F.relu(self.conv1(x))
+        x = self.pool1(x)
+        x = F.relu(self.conv2(x))
+        x = self.pool2(x)
+        x = F.relu(self.conv3(x))
+        x = self.pool3(x)
+        x = self.gap(x)
+        x = torch.flatten(x, 1)
+        x = self.dropout(F.relu(self.fc1(x)))
+        x = self.fc2(x)
+        return x
+
+# ============================================================
+# ✅ Inference model loading
+# ============================================================
+def _is_fresh(cache_path, source_path):
+    return cache_path.exists() and cache_path.stat().st_mtime >= source_path.stat().st_mtime
+
+
+def load_model(path, device, num_classes=4, max_batch_size=1, int8_path=None):
+    """Return a TorchScript RetinaCNN for inference on ``device``.
+
+    On CPU the INT8 model at ``int8_path`` (see quantize_model.py) is used
+    when present and at least as new as ``path``. Otherwise the weights at
+    ``path`` are traced for inputs of shape (N, 3, 224, 224) with
+    N <= ``max_batch_size`` and, on CUDA, compiled with Torch-TensorRT when it
+    is installed (falling back to the TorchScript trace if compilation fails).
+    Traced and compiled modules are saved next to ``path`` as
+    ``<stem>.<device>.jit.pt`` and ``<stem>.<device>.b<max_batch_size>.trt.jit.pt``
+    so later cold starts skip that work; they are rebuilt when ``path`` is newer.
+    """
+    path = Path(path)
+    if device == "cpu" and int8_path is not None and Path(int8_path).exists():
+        int8_path = Path(int8_path)
+        if _is_fresh(int8_path, path):
+            print(f"✅ Loaded INT8 RetinaCNN model from: {int8_path}")
+            return torch.jit.load(str(int8_path), map_location="cpu")
+        print(f"⚠️ {int8_path} is older than {path}; serving the FP32 model. "
+              f"Re-run quantize_model.py to refresh it.")
+
+    try:
+        import torch_tensorrt
+    except ImportError:
+        torch_tensorrt = None
+    use_trt = device == "cuda" and torch_tensorrt is not None
+
+    # A .pt suffix keeps these binaries out of the frontend's **/*.ts globs.
+    ts_path = path.with_name(f"{path.stem}.{device}.jit.pt")
+    # The engine's max input shape is baked in, so key its cache on it.
+    trt_path = path.with_name(f"{path.stem}.{device}.b{max_batch_size}.trt.jit.pt")
+
+    # Cached engines/graphs can become unloadable (different GPU, torch or
+    # TensorRT version); in that case they are rebuilt below.
+    if use_trt and _is_fresh(trt_path, path):
+        try:
+            trt_model = torch.jit.load(str(trt_path), map_location=device)
+        except Exception as e:
+            print(f"⚠️ Could not load {trt_path}, rebuilding it: {e}")
+        else:
+            print(f"✅ Loaded Torch-TensorRT RetinaCNN model from: {trt_path}")
+            return trt_model
+
+    traced = None
+    if _is_fresh(ts_path, path):
+        try:
+            traced = torch.jit.load(str(ts_path), map_location=device)
+        except Exception as e:
+            print(f"⚠️ Could not load {ts_path}, re-tracing: {e}")
+        else:
+            print(f"✅ Loaded TorchScript RetinaCNN model from: {ts_path}")
+    if traced is None:
+        model = RetinaCNN(num_classes=num_classes)
+        model.load_state_dict(torch.load(path, map_location=device))
+        model.to(device)
+        model.eval()
+        with torch.no_grad():
+            traced = torch.jit.freeze(
+                torch.jit.trace(model, torch.zeros(1, 3, 224, 224, device=device))
+            )
+        torch.jit.save(traced, str(ts_path))
+        print(f"✅ Loaded RetinaCNN model from: {path} (TorchScript saved to {ts_path})")
+
+    if use_trt:
+        try:
+            trt_model = torch_tensorrt.compile(
+                traced,
+                ir="ts",
+                inputs=[torch_tensorrt.Input(
+                    min_shape=(1, 3, 224, 224),
+                    opt_shape=(max_batch_size, 3, 224, 224),
+                    max_shape=(max_batch_size, 3, 224, 224),
+                )],
+                enabled_precisions={torch.float, torch.half},
+            )
+        except Exception as e:
+            print(f"⚠️ Torch-TensorRT compilation failed, serving TorchScript instead: {e}")
+        else:
+            torch.jit.save(trt_model, str(trt_path))
+            print(f"⚡ Compiled model with Torch-TensorRT (saved to {trt_path})")
+            return trt_model
+
+    # Device-specific rewrites (e.g. MKLDNN prepacking) aren't serializable,
+    # so they are applied after loading rather than cached.
+    return torch.jit.optimize_for_inference(traced)
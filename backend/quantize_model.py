@@ -0,0 +1,61 @@
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from torch.utils.data import DataLoader, Subset
+from torchvision import datasets, transforms
+from tqdm import tqdm
+
+from model import RetinaCNN
+
+# ============================================================
+# ✅ Configuration
+# ============================================================
+DATA_DIR = "retinal-samples"   # calibration images (class subfolders)
+MODEL_PATH = "model.pth"
+INT8_MODEL_PATH = "model_int8.pth"
+NUM_CLASSES = 4  # Cataract, DR, Glaucoma, Normal
+NUM_CALIBRATION_SAMPLES = 100
+QUANT_BACKEND = "x86"  # uses VNNI int8 kernels on modern x86 CPUs
+
+# Must match the PIL preprocessing in inference.py.
+transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406],
+                         [0.229, 0.224, 0.225])
+])
+
+
+def main():
+    """Post-training static INT8 quantization of model.pth for CPU inference.
+
+    FX graph mode is used so the functional ReLUs in ``RetinaCNN.forward``
+    are fused with their convs without editing the model. The result is a
+    frozen TorchScript module that the backends load when CUDA is unavailable.
+    """
+    torch.backends.quantized.engine = QUANT_BACKEND
+
+    model = RetinaCNN(num_classes=NUM_CLASSES)
+    model.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
+    model.eval()
+
+    example_input = torch.zeros(1, 3, 224, 224)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(QUANT_BACKEND), (example_input,))
+
+    # Calibrate activation ranges on a random subset of the training images.
+    dataset = datasets.ImageFolder(DATA_DIR, transform=transform)
+    indices = torch.randperm(len(dataset))[:NUM_CALIBRATION_SAMPLES].tolist()
+    calib_loader = DataLoader(Subset(dataset, indices), batch_size=1)
+    with torch.no_grad():
+        for images, _ in tqdm(calib_loader, desc="Calibrating"):
+            prepared(images)
+
+    quantized = convert_fx(prepared)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(quantized, example_input))
+    torch.jit.save(scripted, INT8_MODEL_PATH)
+    print(f"✅ INT8 model saved to {INT8_MODEL_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,33 @@
+import os
 import torch
 import torch.nn as nn
 import torch.optim as optim
-import torch.nn.functional as F
-from torchvision import datasets, transforms
+import kornia.augmentation as K
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 
+from cache_dataset import CachedImageDataset, build_cache, cache_is_current
+from model import RetinaCNN
+
 # ============================================================
 # ✅ Configuration
 # ============================================================
 DATA_DIR = "retinal-samples"   # your folder containing class subfolders
+CACHE_DIR = "retinal-cache"    # resized uint8 copy of DATA_DIR (see cache_dataset.py)
 MODEL_PATH = "model.pth"
-BATCH_SIZE = 32
+# Every epoch drops the last len(dataset) % BATCH_SIZE images (drop_last keeps
+# the batch shape fixed for cuDNN autotuning and CUDA Graphs). Shuffling means
+# different images are dropped each epoch, but on small datasets (e.g. the 340
+# image minimum, which loses 84 per epoch) a smaller BATCH_SIZE wastes less.
+# The batch size is clamped to the dataset size so tiny datasets still train.
+BATCH_SIZE = 128
 NUM_EPOCHS = 10
-LEARNING_RATE = 0.001
+LEARNING_RATE = 0.004  # scaled linearly with the batch size (0.001 @ 32)
+# Gradient accumulation: on GPUs that run out of memory at BATCH_SIZE=128,
+# use BATCH_SIZE = 32 and ACCUM_STEPS = 4 for the same effective batch.
+ACCUM_STEPS = 1
 NUM_CLASSES = 4  # Cataract, DR, Glaucoma, Normal
+NUM_WORKERS = min(8, os.cpu_count() or 0)  # DataLoader worker processes
 DEVICE = (
     "cuda"
     if torch.cuda.is_available()
@@ -22,94 +35,253 @@ DEVICE = (
     if torch.backends.mps.is_available()
     else "cpu"
 )
+# Mixed precision (AMP) is only enabled on CUDA.
+USE_AMP = DEVICE == "cuda"
+# TorchInductor compiles forward + loss (and its backward) into fused kernels.
+USE_COMPILE = DEVICE == "cuda"
+# Capture forward + backward manually as one CUDA Graph (CUDA only). The two
+# flags are independent: with USE_CUDA_GRAPH = False and USE_COMPILE = True,
+# torch.compile's "reduce-overhead" mode manages CUDA Graphs itself instead.
+USE_CUDA_GRAPH = DEVICE == "cuda"
+CUDA_GRAPH_WARMUP_ITERS = 3
+# NHWC lets cuDNN pick tensor-core conv kernels without layout transposes.
+MEMORY_FORMAT = torch.channels_last if DEVICE == "cuda" else torch.contiguous_format
 
-print(f"🧠 Using device: {DEVICE}")
-
-# ============================================================
-# ✅ CNN Model Definition
-# ============================================================
-class RetinaCNN(nn.Module):
-    def __init__(self, num_classes=4):
-        super(RetinaCNN, self).__init__()
-        self.conv1 = nn.Conv2d(3, 32, kernel_size=3, stride=1, padding=1)
-        self.pool1 = nn.MaxPool2d(2, 2)
-        
-        self.conv2 = nn.Conv2d(32, 64, kernel_size=3, stride=1, padding=1)
-        self.pool2 = nn.MaxPool2d(2, 2)
-        
-        self.conv3 = nn.Conv2d(64, 128, kernel_size=3, stride=1, padding=1)
-        self.pool3 = nn.MaxPool2d(2, 2)
-        
-        self.dropout = nn.Dropout(0.5)
-        self.fc1 = nn.Linear(128 * 28 * 28, 256)
-        self.fc2 = nn.Linear(256, num_classes)
-
-    def forward(self, x):
-        x = F.relu(self.conv1(x))
-        x = self.pool1(x)
-        x = F.relu(self.conv2(x))
-        x = self.pool2(x)
-        x = F.relu(self.conv3(x))
-        x = self.pool3(x)
-        x = torch.flatten(x, 1)
-        x = self.dropout(F.relu(self.fc1(x)))
-        x = self.fc2(x)
-        return x
+# Input shape is fixed (224x224), so let cuDNN autotune conv algorithms once,
+# and allow TF32 tensor-core math for FP32 matmuls/convs on Ampere+.
+torch.backends.cudnn.benchmark = True
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+torch.set_float32_matmul_precision("high")
 
 # ============================================================
 # ✅ Transforms, Dataset, and Dataloader
 # ============================================================
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.RandomHorizontalFlip(),
-    transforms.RandomRotation(10),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406],
-                         [0.229, 0.224, 0.225])
-])
-
-dataset = datasets.ImageFolder(DATA_DIR, transform=transform)
-train_loader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True)
-print(f"📂 Found {len(dataset)} images across {len(dataset.classes)} classes.")
+# Images come from the cache already resized to 224x224 as uint8 tensors.
+# The random flip/rotation and normalization run batched on DEVICE after
+# the (4x smaller) uint8 H2D copy, leaving CPU workers with just the reads.
+def make_augment():
+    mean = torch.tensor([0.485, 0.456, 0.406], device=DEVICE)
+    std = torch.tensor([0.229, 0.224, 0.225], device=DEVICE)
+    # K.Normalize keeps mean/std as plain attributes (not buffers), so they
+    # are created on DEVICE up front rather than relying on .to(DEVICE).
+    return nn.Sequential(
+        K.RandomHorizontalFlip(p=0.5),
+        K.RandomRotation(degrees=10.0),
+        K.Normalize(mean=mean, std=std),
+    ).to(DEVICE)
 
-# ============================================================
-# ✅ Model, Loss, Optimizer
-# ============================================================
-model = RetinaCNN(num_classes=NUM_CLASSES).to(DEVICE)
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
+def prefetch_to_device(loader):
+    """Yield ``(images, labels)`` already on DEVICE, copying one batch ahead.
+
+    On CUDA the H2D copy of the next batch is issued on a side stream while
+    the current batch is being trained on, so the compute stream only waits
+    for a copy that has (usually) already finished.
+    """
+    if DEVICE != "cuda":
+        for images, labels in loader:
+            yield images.to(DEVICE), labels.to(DEVICE)
+        return
+
+    copy_stream = torch.cuda.Stream()
+
+    def to_device(images, labels):
+        with torch.cuda.stream(copy_stream):
+            return (images.to(DEVICE, non_blocking=True),
+                    labels.to(DEVICE, non_blocking=True))
+
+    batches = iter(loader)
+    first = next(batches, None)
+    if first is None:
+        return
+    next_batch = to_device(*first)
+    for images, labels in batches:
+        torch.cuda.current_stream().wait_stream(copy_stream)
+        current = next_batch
+        # Tell the caching allocator these buffers are now used on the
+        # compute stream so they aren't recycled by the next side-stream copy.
+        for tensor in current:
+            tensor.record_stream(torch.cuda.current_stream())
+        next_batch = to_device(images, labels)
+        yield current
+    torch.cuda.current_stream().wait_stream(copy_stream)
+    for tensor in next_batch:
+        tensor.record_stream(torch.cuda.current_stream())
+    yield next_batch
 
 # ============================================================
-# ✅ Training Loop
+# ✅ Training Step (eager or CUDA Graph)
 # ============================================================
-print(f"🚀 Starting training for {NUM_EPOCHS} epochs...")
+def make_train_step(model, criterion, scaler):
+    """Return ``step(images, labels) -> (outputs, loss)`` running forward + backward.
+
+    The optimizer step is left to the caller so ``GradScaler`` can skip it
+    on inf/NaN gradients. Gradients are scaled by ``1 / ACCUM_STEPS`` so they
+    can be accumulated over several steps. On CUDA the forward/backward is
+    captured once as a CUDA Graph and replayed, which requires every batch to
+    have the same shape.
+    """
+    def forward_loss(images, labels):
+        outputs = model(images)
+        return outputs, criterion(outputs, labels)
+
+    if USE_COMPILE:
+        # backward() stays outside the compiled region (Dynamo can't trace it
+        # with fullgraph=True); AOTAutograd still compiles the backward graph.
+        # The manual CUDA Graph below already removes launch overhead, so
+        # Inductor's own cudagraphs are disabled in that case.
+        forward_loss = torch.compile(
+            forward_loss,
+            mode="max-autotune-no-cudagraphs" if USE_CUDA_GRAPH else "reduce-overhead",
+            fullgraph=True,
+        )
+
+    # CUDA Graph capture requires the autocast cache off, and warmup must use
+    # the same autocast state or Dynamo recompiles (and autotunes) mid-capture.
+    def autocast():
+        return torch.cuda.amp.autocast(enabled=USE_AMP, cache_enabled=False)
+
+    def eager_step(images, labels):
+        with autocast():
+            outputs, loss = forward_loss(images, labels)
+        scaler.scale(loss / ACCUM_STEPS).backward()
+        return outputs, loss
+
+    if not USE_CUDA_GRAPH:
+        return eager_step
+
+    graph = None
+    static = {}
+
+    def graph_step(images, labels):
+        nonlocal graph
+        if graph is None:
+            static["images"] = images.clone()
+            static["labels"] = labels.clone()
+
+            # Warm up on a side stream so lazy init/autotuning is not captured.
+            side = torch.cuda.Stream()
+            side.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(side):
+                for _ in range(CUDA_GRAPH_WARMUP_ITERS):
+                    model.zero_grad(set_to_none=True)
+                    eager_step(static["images"], static["labels"])
+            torch.cuda.current_stream().wait_stream(side)
+
+            # Without accumulation, grads allocated inside the capture are
+            # overwritten on every replay, so no zero_grad is needed later.
+            # With accumulation, the capture adds into the existing grad
+            # buffers and the caller clears them in place after each step.
+            model.zero_grad(set_to_none=(ACCUM_STEPS == 1))
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                with autocast():
+                    static["outputs"], static["loss"] = forward_loss(static["images"], static["labels"])
+                scaler.scale(static["loss"] / ACCUM_STEPS).backward()
+
+        static["images"].copy_(images, non_blocking=True)
+        static["labels"].copy_(labels, non_blocking=True)
+        graph.replay()
+        return static["outputs"], static["loss"]
+
+    return graph_step
+
+def main():
+    print(f"🧠 Using device: {DEVICE}")
+
+    if not cache_is_current(DATA_DIR, CACHE_DIR):
+        print(f"🗂️ Image cache at {CACHE_DIR} is missing or out of date, building it from {DATA_DIR}...")
+        build_cache(DATA_DIR, CACHE_DIR)
+    dataset = CachedImageDataset(CACHE_DIR)
+    if len(dataset) == 0:
+        raise SystemExit(f"❌ No training images found in {DATA_DIR}.")
+    batch_size = min(BATCH_SIZE, len(dataset))
+    if batch_size < BATCH_SIZE:
+        print(f"⚠️ Only {len(dataset)} images; reducing batch size from {BATCH_SIZE} to {batch_size}.")
+    dropped = len(dataset) % batch_size
+    if dropped:
+        print(f"⚠️ {dropped} of {len(dataset)} images are skipped each epoch (drop_last=True).")
+
+    augment = make_augment()
+    train_loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        drop_last=True,  # fixed batch shape for cuDNN autotuning and CUDA Graphs
+        num_workers=NUM_WORKERS,  # read cached samples in parallel worker processes
+        persistent_workers=NUM_WORKERS > 0,
+        prefetch_factor=2 if NUM_WORKERS > 0 else None,
+        pin_memory=(DEVICE == "cuda"),  # page-locked buffers allow async H2D copies
+    )
+    print(f"📂 Found {len(dataset)} images across {len(dataset.classes)} classes.")
+
+    # ============================================================
+    # ✅ Model, Loss, Optimizer
+    # ============================================================
+    model = RetinaCNN(num_classes=NUM_CLASSES).to(DEVICE, memory_format=MEMORY_FORMAT)
+    criterion = nn.CrossEntropyLoss()
+    # Fused Adam updates all parameters in a single CUDA kernel per step.
+    optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE, fused=(DEVICE == "cuda"))
+    scaler = torch.cuda.amp.GradScaler(enabled=USE_AMP)
+
+    # ============================================================
+    # ✅ Training Loop
+    # ============================================================
+    print(f"🚀 Starting training for {NUM_EPOCHS} epochs...")
 
-for epoch in range(NUM_EPOCHS):
     model.train()
-    running_loss = 0.0
-    correct = 0
-    total = 0
+    train_step = make_train_step(model, criterion, scaler)
 
-    for images, labels in tqdm(train_loader, desc=f"Epoch {epoch+1}/{NUM_EPOCHS}"):
-        images, labels = images.to(DEVICE), labels.to(DEVICE)
+    # Pay for compilation / graph capture on a dummy batch before the progress
+    # bar starts, then discard the gradients it produced.
+    if USE_COMPILE or USE_CUDA_GRAPH:
+        dummy_images = torch.zeros(batch_size, 3, 224, 224, device=DEVICE)
+        dummy_labels = torch.zeros(batch_size, dtype=torch.long, device=DEVICE)
+        train_step(dummy_images.contiguous(memory_format=MEMORY_FORMAT), dummy_labels)
+        optimizer.zero_grad(set_to_none=not USE_CUDA_GRAPH)
 
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
+    for epoch in range(NUM_EPOCHS):
+        # Accumulate metrics on the device and sync once per epoch instead
+        # of calling .item() every step.
+        running_loss = torch.zeros((), device=DEVICE)
+        correct = torch.zeros((), dtype=torch.long, device=DEVICE)
+        total = 0
 
-        running_loss += loss.item()
-        _, predicted = torch.max(outputs, 1)
-        total += labels.size(0)
-        correct += (predicted == labels).sum().item()
+        progress = tqdm(
+            prefetch_to_device(train_loader),
+            total=len(train_loader),
+            desc=f"Epoch {epoch+1}/{NUM_EPOCHS}",
+        )
+        for step, (images, labels) in enumerate(progress):
+            images = augment(images.float().div_(255)).contiguous(memory_format=MEMORY_FORMAT)
 
-    epoch_loss = running_loss / len(train_loader)
-    epoch_acc = 100 * correct / total
-    print(f"📊 Epoch [{epoch+1}/{NUM_EPOCHS}] | Loss: {epoch_loss:.4f} | Accuracy: {epoch_acc:.2f}%")
+            outputs, loss = train_step(images, labels)
+            # Also step on the last batch so leftover accumulated grads don't
+            # leak into the next epoch (or get dropped after the final one).
+            if (step + 1) % ACCUM_STEPS == 0 or step + 1 == len(train_loader):
+                scaler.step(optimizer)
+                scaler.update()
+                if not USE_CUDA_GRAPH:
+                    optimizer.zero_grad(set_to_none=True)
+                elif ACCUM_STEPS > 1:
+                    optimizer.zero_grad(set_to_none=False)
 
-# ============================================================
-# ✅ Save Model
-# ============================================================
-torch.save(model.state_dict(), MODEL_PATH)
-print(f"✅ Model saved to {MODEL_PATH}")
+            running_loss += loss.detach().float()
+            correct += (outputs.argmax(1) == labels).sum()
+            total += labels.size(0)
+
+        epoch_loss = (running_loss / len(train_loader)).item()
+        epoch_acc = 100 * correct.item() / total
+        print(f"📊 Epoch [{epoch+1}/{NUM_EPOCHS}] | Loss: {epoch_loss:.4f} | Accuracy: {epoch_acc:.2f}%")
+
+    # ============================================================
+    # ✅ Save Model
+    # ============================================================
+    torch.save(model.state_dict(), MODEL_PATH)
+    print(f"✅ Model saved to {MODEL_PATH}")
+
+
+# Worker processes re-import this module under the "spawn" start method
+# (Windows/macOS), so training must only run from the main process.
+if __name__ == "__main__":
+    main()